@@ -6,13 +6,10 @@ import sys
 from pathlib import Path
 from typing import Dict, Any
 
-from .config import (
-    QUEUE_DIR, RUNNING_DIR, FINISHED_DIR, PENDING, RUNNING, COMPLETED, FAILED, CANCELLED
-)
-from .utils import read_json
 from .state import get_limits, get_usage, init_system
 from .job import create_job, get_job_meta, cancel_job
 from .scheduler import run_scheduler_cycle, run_scheduler
+from . import index
 
 
 def cmd_submit(args: argparse.Namespace) -> None:
@@ -33,55 +30,14 @@ def cmd_submit(args: argparse.Namespace) -> None:
 
 def cmd_q(args: argparse.Namespace) -> None:
     """List jobs with their status."""
-    jobs = []
-    
-    # Collect all jobs from all directories
-    for state, state_dir in [(PENDING, QUEUE_DIR), (RUNNING, RUNNING_DIR)]:
-        for job_dir in state_dir.iterdir():
-            if not job_dir.is_dir():
-                continue
-                
-            meta_file = job_dir / "meta.json"
-            if meta_file.exists():
-                meta_data = read_json(meta_file)
-                jobs.append({
-                    "job_id": meta_data.get("job_id"),
-                    "name": meta_data.get("name"),
-                    "user": meta_data.get("user"),
-                    "state": state,
-                    "submit_time": meta_data.get("submit_time"),
-                    "start_time": meta_data.get("start_time")
-                })
-    
-    # Also include recent finished jobs (last 20)
-    finished_jobs = []
-    for job_dir in FINISHED_DIR.iterdir():
-        if not job_dir.is_dir():
-            continue
-            
-        meta_file = job_dir / "meta.json"
-        if meta_file.exists():
-            meta_data = read_json(meta_file)
-            finished_jobs.append({
-                "job_id": meta_data.get("job_id"),
-                "name": meta_data.get("name"),
-                "user": meta_data.get("user"),
-                "state": meta_data.get("state"),
-                "submit_time": meta_data.get("submit_time"),
-                "start_time": meta_data.get("start_time"),
-                "end_time": meta_data.get("end_time")
-            })
-    
-    # Sort finished jobs by end time and take the last 20
-    finished_jobs.sort(key=lambda x: x.get("end_time", ""), reverse=True)
-    jobs.extend(finished_jobs[:20])
-    
-    # Sort all jobs by submission time
-    jobs.sort(key=lambda x: x.get("submit_time", ""))
-    
-    # Print job list
-    print(f"{'JOBID':<20} {'NAME':<20} {'USER':<15} {'STATE':<12} {'SUBMIT_TIME':<20}")
-    print("-" * 85)
+    # Active jobs plus the 20 most recently finished, sorted by submission time
+    jobs = index.list_jobs(finished_limit=20)
+    
+    # Build the whole listing and write it at once
+    lines = [
+        f"{'JOBID':<20} {'NAME':<20} {'USER':<15} {'STATE':<12} {'SUBMIT_TIME':<20}",
+        "-" * 85
+    ]
     
     for job in jobs:
         job_id = job.get("job_id", "N/A")
@@ -90,7 +46,9 @@ def cmd_q(args: argparse.Namespace) -> None:
         state = job.get("state", "N/A")
         submit_time = job.get("submit_time", "N/A")[:19]  # Truncate to show only datetime
         
-        print(f"{job_id:<20} {name:<20} {user:<15} {state:<12} {submit_time:<20}")
+        lines.append(f"{job_id:<20} {name:<20} {user:<15} {state:<12} {submit_time:<20}")
+    
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
 def cmd_info(args: argparse.Namespace) -> None:
@@ -131,6 +89,12 @@ def cmd_nodes(args: argparse.Namespace) -> None:
     print(f"  Available:    {limits['mem_mb_total'] - usage['mem_mb_used']} MB")
 
 
+def cmd_reindex(args: argparse.Namespace) -> None:
+    """Rebuild the job index from the job directories."""
+    count = index.rebuild()
+    print(f"Indexed {count} jobs")
+
+
 def cmd_run_scheduler(args: argparse.Namespace) -> None:
     """Run the scheduler."""
     poll_interval = args.interval or 5  # Default to 5 seconds
@@ -177,6 +141,10 @@ def main():
     nodes_parser = subparsers.add_parser("nodes", help="Show system resources")
     nodes_parser.set_defaults(func=cmd_nodes)
     
+    # reindex command
+    reindex_parser = subparsers.add_parser("reindex", help="Rebuild the job index from disk")
+    reindex_parser.set_defaults(func=cmd_reindex)
+    
     # scheduler command
     scheduler_parser = subparsers.add_parser("scheduler", help="Run the scheduler")
     scheduler_parser.add_argument("--interval", type=int, help="Poll interval in seconds")
@@ -11,12 +11,16 @@ QUEUE_DIR = BASE_DIR / "queue"
 RUNNING_DIR = BASE_DIR / "running"
 FINISHED_DIR = BASE_DIR / "finished"
 LOCKS_DIR = BASE_DIR / "locks"
+TRASH_DIR = BASE_DIR / ".trash"
 
 # Configuration files
 LIMITS_FILE = BASE_DIR / "limits.json"
 USAGE_FILE = BASE_DIR / "usage.json"
 JOBID_COUNTER_FILE = BASE_DIR / "jobid_counter"
 CONFIG_FILE = BASE_DIR / "config.json"
+INDEX_FILE = BASE_DIR / "jobs.db"
+# Touched after a job is indexed, to wake a scheduler watching the queue
+WAKE_FILE = QUEUE_DIR / ".wake"
 
 # Default configuration values
 DEFAULT_POLL_INTERVAL_SEC = 5
@@ -25,6 +29,14 @@ DEFAULT_STDERR = "stderr.log"
 DEFAULT_WORKDIR = "."
 HISTORY_KEEP = 100
 
+# How job IDs are allocated: "counter" uses the shared jobid_counter file and
+# gives YYYYMMDD-NNNN; "sharded" keeps a counter file per process ID in
+# LOCKS_DIR and gives YYYYMMDD-PPPPP-NNNN; "process" needs no file access or
+# locking and gives YYYYMMDD-<pid hex>-<monotonic microseconds>. Its IDs
+# can collide if the machine reboots and a new process gets an earlier one's
+# pid on the same day, so only use it where that is acceptable
+JOBID_SCHEME = "counter"
+
 # Job metadata filename
 META_FILE = "meta.json"
 SCRIPT_FILE = "script.sh"
@@ -0,0 +1,92 @@
+"""Scheduler wakeup events for the job scheduling system.
+
+The scheduler loop sleeps until a job is submitted to the queue (the submitter
+touches WAKE_FILE once the job is indexed, watched with inotify when
+inotify_simple is installed) or a job unit exits (the systemd
+UnitRemoved signal, when D-Bus is available), or until the poll interval ends.
+"""
+
+import os
+import select
+import time
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+from .config import QUEUE_DIR, WAKE_FILE, SYSTEMD_UNIT_TEMPLATE
+from .utils import ensure_dir
+from . import systemd
+
+_UNIT_PREFIX = SYSTEMD_UNIT_TEMPLATE.format(jobid="")
+
+
+def notify_submitted() -> None:
+    """Wake a scheduler waiting on the queue after a job has been indexed."""
+    try:
+        WAKE_FILE.touch()
+    except OSError:
+        pass  # The scheduler still finds the job on its next poll
+
+
+class SchedulerEvents:
+    """Wait for new queued jobs or finished job units."""
+
+    def __init__(self):
+        # Self-pipe the D-Bus signal thread writes to
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+
+        self._inotify = None
+        if INotify is not None:
+            ensure_dir(str(QUEUE_DIR))
+            try:
+                inotify = INotify()
+                # Touching an existing file is an ATTRIB event, creating it a CLOSE_WRITE
+                inotify.add_watch(str(QUEUE_DIR), flags.ATTRIB | flags.CLOSE_WRITE)
+                self._inotify = inotify
+            except OSError:
+                pass
+
+        systemd.subscribe_unit_removed(self._on_unit_removed)
+
+    def _on_unit_removed(self, unit_name: str) -> None:
+        """Wake the scheduler when a job unit is unloaded after exiting."""
+        if unit_name.startswith(_UNIT_PREFIX):
+            try:
+                os.write(self._wake_w, b"\0")
+            except BlockingIOError:
+                pass  # A wakeup is already pending
+
+    def _drain_inotify(self) -> bool:
+        """Consume queued inotify events, returning whether a job was submitted."""
+        return any(event.name == WAKE_FILE.name for event in self._inotify.read(timeout=0))
+
+    def wait(self, timeout: float) -> None:
+        """Block until a relevant event arrives or timeout seconds pass."""
+        fds = [self._wake_r]
+        if self._inotify is not None:
+            fds.append(self._inotify.fileno())
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+
+            readable, _, _ = select.select(fds, [], [], remaining)
+            woke = False
+            if self._wake_r in readable:
+                try:
+                    while os.read(self._wake_r, 512):
+                        pass
+                except BlockingIOError:
+                    pass
+                woke = True
+            if self._inotify is not None and self._inotify.fileno() in readable:
+                woke = self._drain_inotify() or woke
+
+            if woke:
+                return
@@ -0,0 +1,174 @@
+"""SQLite index of job metadata for the job scheduling system."""
+
+import os
+import sqlite3
+from typing import Dict, Any, List, Optional, Sequence, Union
+
+from .config import (
+    BASE_DIR, INDEX_FILE, QUEUE_DIR, RUNNING_DIR, FINISHED_DIR, META_FILE,
+    PENDING, RUNNING, COMPLETED, FAILED, CANCELLED
+)
+from .utils import ensure_dir, read_many_json, scan_job_dirs
+
+_COLUMNS = ("job_id", "name", "user", "state", "submit_time", "end_time",
+            "cores", "mem_mb", "unit_name", "workdir")
+
+# Columns that may be used in ORDER BY clauses
+_ORDER_COLUMNS = {"job_id", "state", "submit_time", "end_time", "cores", "mem_mb"}
+
+_conn: Optional[sqlite3.Connection] = None
+
+
+def connect() -> sqlite3.Connection:
+    """Return the process-wide index connection, creating the index if needed."""
+    global _conn
+    if _conn is not None:
+        return _conn
+
+    ensure_dir(str(BASE_DIR))
+    is_new = not INDEX_FILE.exists()
+
+    conn = sqlite3.connect(str(INDEX_FILE), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    # WAL lets the scheduler and CLI read while the other one writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        " job_id TEXT PRIMARY KEY,"
+        " name TEXT,"
+        " user TEXT,"
+        " state TEXT NOT NULL,"
+        " submit_time TEXT,"
+        " end_time TEXT,"
+        " cores INTEGER,"
+        " mem_mb INTEGER,"
+        " unit_name TEXT,"
+        " workdir TEXT)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_state_submit ON jobs (state, submit_time)")
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_state_end ON jobs (state, end_time)")
+    # Which state directory holds each job; maintained by the location module
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS locations ("
+        " job_id TEXT PRIMARY KEY,"
+        " dir TEXT NOT NULL)"
+    )
+    _conn = conn
+
+    # Populate a fresh index from jobs that were submitted before it existed
+    if is_new:
+        rebuild()
+
+    return conn
+
+
+def _row_values(meta: Dict[str, Any]) -> tuple:
+    """Flatten job metadata into a row for the jobs table."""
+    req = meta.get("req") or {}
+    return (
+        meta["job_id"],
+        meta.get("name"),
+        meta.get("user"),
+        meta.get("state"),
+        meta.get("submit_time"),
+        meta.get("end_time"),
+        req.get("cores", 1),
+        req.get("mem_mb", 1024),
+        meta.get("unit_name"),
+        meta.get("workdir"),
+    )
+
+
+def upsert_job(meta: Dict[str, Any]) -> None:
+    """Insert or update the index entry for a job."""
+    placeholders = ", ".join("?" * len(_COLUMNS))
+    connect().execute(
+        f"INSERT OR REPLACE INTO jobs ({', '.join(_COLUMNS)}) VALUES ({placeholders})",
+        _row_values(meta)
+    )
+
+
+def delete_job(job_id: str) -> None:
+    """Remove a job from the index."""
+    connect().execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+
+def query(state: Union[str, Sequence[str], None] = None, order_by: str = "submit_time",
+          limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Query indexed jobs, optionally filtered by one or more states."""
+    sql = "SELECT * FROM jobs"
+    params: List[Any] = []
+
+    if state is not None:
+        states = [state] if isinstance(state, str) else list(state)
+        sql += f" WHERE state IN ({', '.join('?' * len(states))})"
+        params.extend(states)
+
+    # Validate ORDER BY since it cannot be passed as a parameter
+    column, _, direction = order_by.partition(" ")
+    direction = direction.strip().upper()
+    if column not in _ORDER_COLUMNS or direction not in ("", "ASC", "DESC"):
+        raise ValueError(f"Invalid order_by: {order_by}")
+    sql += f" ORDER BY {column} {direction}".rstrip()
+
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+
+    return [dict(row) for row in connect().execute(sql, params)]
+
+
+def count_jobs(state: str) -> int:
+    """Return the number of indexed jobs in the given state."""
+    return connect().execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (state,)).fetchone()[0]
+
+
+def list_jobs(finished_limit: int = 20) -> List[Dict[str, Any]]:
+    """List active jobs plus the most recently finished ones, by submission time."""
+    sql = (
+        "SELECT * FROM jobs WHERE state IN (?, ?)"
+        " UNION ALL"
+        " SELECT * FROM (SELECT * FROM jobs WHERE state IN (?, ?, ?)"
+        " ORDER BY end_time DESC LIMIT ?)"
+        " ORDER BY submit_time"
+    )
+    params = (PENDING, RUNNING, COMPLETED, FAILED, CANCELLED, finished_limit)
+    return [dict(row) for row in connect().execute(sql, params)]
+
+
+def expired_jobs(history_keep: int) -> List[str]:
+    """Return finished jobs older than the history_keep most recent ones."""
+    sql = (
+        "SELECT job_id FROM jobs WHERE state IN (?, ?, ?) AND end_time IS NOT NULL"
+        " ORDER BY end_time DESC LIMIT -1 OFFSET ?"
+    )
+    params = (COMPLETED, FAILED, CANCELLED, history_keep)
+    return [row["job_id"] for row in connect().execute(sql, params)]
+
+
+def rebuild() -> int:
+    """Rebuild the index and job locations from the meta.json files on disk."""
+    conn = connect()
+    count = 0
+
+    conn.execute("BEGIN")
+    try:
+        conn.execute("DELETE FROM jobs")
+        conn.execute("DELETE FROM locations")
+        for state_dir in [QUEUE_DIR, RUNNING_DIR, FINISHED_DIR]:
+            meta_files = [os.path.join(entry.path, META_FILE) for entry in scan_job_dirs(state_dir)]
+            for meta_data in read_many_json(meta_files):
+                if meta_data.get("job_id"):
+                    upsert_job(meta_data)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO locations (job_id, dir) VALUES (?, ?)",
+                        (meta_data["job_id"], state_dir.name)
+                    )
+                    count += 1
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+    return count
@@ -2,18 +2,59 @@
 
 import json
 import os
-import re
 import shutil
-import subprocess
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, Optional, Tuple
 
 from .config import (
     QUEUE_DIR, RUNNING_DIR, FINISHED_DIR, META_FILE, SCRIPT_FILE,
     PENDING, RUNNING, COMPLETED, FAILED, CANCELLED, SYSTEMD_UNIT_TEMPLATE
 )
-from .utils import read_json, write_json, iso8601_now, expand_paths
+from .utils import read_json, write_json, iso8601_now, expand_paths, ensure_dir
 from .state import get_next_jobid, update_usage
+from . import index, location, systemd
+from .events import notify_submitted
+
+# #JS directive keys -> (section of the parsed header or None for top level, field, converter)
+_DIRECTIVES = {
+    "cores": ("req", "cores", int),
+    "mem_mb": ("req", "mem_mb", int),
+    "time_limit": ("req", "time_limit", str),
+    "stdout": ("io", "stdout", str),
+    "stderr": ("io", "stderr", str),
+    "name": (None, "name", str),
+    "workdir": (None, "workdir", str),
+}
+
+
+def _scan_directive(directive: str) -> Iterator[Tuple[str, str]]:
+    """Yield the key=value pairs of a #JS directive; values may be single or double quoted."""
+    i = 0
+    n = len(directive)
+    while i < n:
+        # Skip whitespace between pairs
+        while i < n and directive[i].isspace():
+            i += 1
+        start = i
+        while i < n and directive[i] != '=' and not directive[i].isspace():
+            i += 1
+        if i >= n or directive[i] != '=':
+            continue  # Bare word without a value
+        key = directive[start:i]
+        i += 1
+        
+        # Quoted values may contain spaces; an unterminated quote is read as a bare value
+        if i < n and directive[i] in '"\'':
+            end = directive.find(directive[i], i + 1)
+            if end != -1:
+                yield key, directive[i + 1:end]
+                i = end + 1
+                continue
+        
+        start = i
+        while i < n and not directive[i].isspace():
+            i += 1
+        yield key, directive[start:i].strip('"\'')
 
 
 def parse_script_header(script_path: Path) -> Dict[str, Any]:
@@ -29,8 +70,12 @@ def parse_script_header(script_path: Path) -> Dict[str, Any]:
         "stderr": "stderr.log"
     }
     
-    name = script_path.stem
-    workdir = str(script_path.parent.absolute())  # Use absolute path
+    header = {
+        "req": req,
+        "io": io,
+        "name": script_path.stem,
+        "workdir": str(script_path.parent.absolute())  # Use absolute path
+    }
     
     with open(script_path, 'r') as f:
         for line in f:
@@ -41,35 +86,16 @@ def parse_script_header(script_path: Path) -> Dict[str, Any]:
                 else:
                     break  # Stop after header comments
             
-            # Parse JS directives
-            directive = line[3:].strip()  # Remove "#JS"
-            
-            # Parse key-value pairs like: cores=4, mem_mb=8192, name="myjob"
-            matches = re.findall(r'(\w+)=("[^"]*"|\'[^\']*\'|\S+)', directive)
-            for key, value in matches:
-                value = value.strip('"\'')  # Remove quotes if present
-                
-                if key == "cores":
-                    req["cores"] = int(value)
-                elif key == "mem_mb":
-                    req["mem_mb"] = int(value)
-                elif key == "time_limit":
-                    req["time_limit"] = value
-                elif key == "stdout":
-                    io["stdout"] = value
-                elif key == "stderr":
-                    io["stderr"] = value
-                elif key == "name":
-                    name = value
-                elif key == "workdir":
-                    workdir = value
-    
-    return {
-        "req": req,
-        "io": io,
-        "name": name,
-        "workdir": workdir
-    }
+            # Parse key-value pairs like: cores=4 mem_mb=8192 name="my job"
+            for key, value in _scan_directive(line[3:]):
+                spec = _DIRECTIVES.get(key)
+                if spec is None:
+                    continue
+                section, field, convert = spec
+                target = header[section] if section else header
+                target[field] = convert(value)
+    
+    return header
 
 
 def create_job(script_path: Path) -> str:
@@ -83,12 +109,15 @@ def create_job(script_path: Path) -> str:
     # Get current user
     user = os.getenv("USER", "unknown")
     
-    # Create job directory in queue
+    # Build the job in a hidden staging directory and rename it into the queue
+    # once it is complete, so the scheduler never sees a half-written job
     job_dir = QUEUE_DIR / job_id
-    job_dir.mkdir(parents=True, exist_ok=True)
+    staging_dir = QUEUE_DIR / f".{job_id}.new"
+    ensure_dir(str(QUEUE_DIR))
+    staging_dir.mkdir(exist_ok=True)
     
     # Copy script to job directory
-    dest_script = job_dir / SCRIPT_FILE
+    dest_script = staging_dir / SCRIPT_FILE
     shutil.copy2(script_path, dest_script)
     
     # Create meta.json
@@ -107,77 +136,134 @@ def create_job(script_path: Path) -> str:
         "exit_code": None
     }
     
-    meta_file = job_dir / META_FILE
+    meta_file = staging_dir / META_FILE
     write_json(meta_file, meta_data)
+    os.rename(staging_dir, job_dir)
+    location.set_job_dir(job_id, QUEUE_DIR)
+    # Index the job only once it is in the queue, so a crash before the rename
+    # leaves no PENDING row without a directory, and wake the scheduler only
+    # once it is indexed, since the scheduler finds pending jobs in the index
+    index.upsert_job(meta_data)
+    notify_submitted()
     
     return job_id
 
 
-def update_state(job_id: str, new_state: str, extra_fields: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-    """Update job state and return updated meta data."""
-    # Find job in any of the directories
+def _probe_job_dir(job_id: str) -> Optional[Path]:
+    """Find a job by checking each state directory, and record where it is."""
     for job_dir in [QUEUE_DIR, RUNNING_DIR, FINISHED_DIR]:
-        meta_file = job_dir / job_id / META_FILE
-        if meta_file.exists():
-            meta_data = read_json(meta_file)
-            
-            old_state = meta_data.get("state")
-            meta_data["state"] = new_state
-            
-            # Update timestamps based on state transition
-            if new_state == RUNNING and old_state == PENDING:
-                meta_data["start_time"] = iso8601_now()
-            elif new_state in [COMPLETED, FAILED, CANCELLED] and old_state in [PENDING, RUNNING]:
-                meta_data["end_time"] = iso8601_now()
-            
-            # Apply any extra fields
-            if extra_fields:
-                meta_data.update(extra_fields)
-            
-            # Update unit name if provided and not already set
-            if new_state == RUNNING and not meta_data.get("unit_name"):
-                meta_data["unit_name"] = SYSTEMD_UNIT_TEMPLATE.format(jobid=job_id)
-            
-            write_json(meta_file, meta_data)
-            return meta_data
+        job_path = job_dir / job_id
+        if job_path.exists():
+            location.set_job_dir(job_id, job_dir)
+            return job_path
+    
+    return None
+
+
+def _find_job_dir(job_id: str) -> Optional[Path]:
+    """Find a job's directory, probing the state directories if its recorded one is gone."""
+    job_path = location.get_job_dir(job_id)
+    if job_path is not None and job_path.exists():
+        return job_path
+    return _probe_job_dir(job_id)
+
+
+def _current_meta_file(job_id: str) -> Optional[Path]:
+    """Find a job's meta.json on disk, ignoring its recorded location."""
+    job_path = _probe_job_dir(job_id)
+    return job_path / META_FILE if job_path is not None else None
+
+
+def _read_job_meta(job_id: str) -> Tuple[Optional[Path], Dict[str, Any]]:
+    """Find and read a job's meta.json, returning its path and contents."""
+    # Try the recorded location first
+    job_path = location.get_job_dir(job_id)
+    if job_path is not None:
+        meta_file = job_path / META_FILE
+        meta_data = read_json(meta_file)
+        if meta_data:
+            return meta_file, meta_data
     
-    raise FileNotFoundError(f"Job {job_id} not found")
+    # The job is not tracked yet or its recorded location is stale
+    job_path = _probe_job_dir(job_id)
+    if job_path is None:
+        return None, {}
+    
+    meta_file = job_path / META_FILE
+    return meta_file, read_json(meta_file)
+
+
+def update_state(job_id: str, new_state: str, extra_fields: Optional[Dict[str, Any]] = None,
+                 existing_meta: Optional[Dict[str, Any]] = None,
+                 meta_file: Optional[Path] = None) -> Dict[str, Any]:
+    """Update job state and return updated meta data.
+
+    Callers that already hold the job's meta data can pass it as
+    existing_meta to skip re-reading meta.json; it is updated in place.
+    Passing its meta_file as well also skips looking up the job directory.
+    """
+    # Find the job
+    if existing_meta is not None:
+        if meta_file is None:
+            job_path = _find_job_dir(job_id)
+            meta_file = job_path / META_FILE if job_path is not None else None
+        meta_data = existing_meta
+    else:
+        meta_file, meta_data = _read_job_meta(job_id)
+    
+    if meta_file is None:
+        raise FileNotFoundError(f"Job {job_id} not found")
+    
+    old_state = meta_data.get("state")
+    meta_data["state"] = new_state
+    
+    # Update timestamps based on state transition
+    if new_state == RUNNING and old_state == PENDING:
+        meta_data["start_time"] = iso8601_now()
+    elif new_state in [COMPLETED, FAILED, CANCELLED] and old_state in [PENDING, RUNNING]:
+        meta_data["end_time"] = iso8601_now()
+    
+    # Apply any extra fields
+    if extra_fields:
+        meta_data.update(extra_fields)
+    
+    # Update unit name if provided and not already set
+    if new_state == RUNNING and not meta_data.get("unit_name"):
+        meta_data["unit_name"] = SYSTEMD_UNIT_TEMPLATE.format(jobid=job_id)
+    
+    write_json(meta_file, meta_data)
+    index.upsert_job(meta_data)
+    return meta_data
 
 
 def get_job_meta(job_id: str) -> Optional[Dict[str, Any]]:
     """Get job metadata by job ID."""
-    for job_dir in [QUEUE_DIR, RUNNING_DIR, FINISHED_DIR]:
-        meta_file = job_dir / job_id / META_FILE
-        if meta_file.exists():
-            return read_json(meta_file)
+    meta_file, meta_data = _read_job_meta(job_id)
+    if meta_file is None:
+        return None
     
-    return None
+    return meta_data
 
 
 def move_job(job_id: str, target_dir: Path) -> Path:
     """Move a job directory to the target directory."""
     # Find current job directory
-    current_dir = None
-    for job_dir in [QUEUE_DIR, RUNNING_DIR, FINISHED_DIR]:
-        job_path = job_dir / job_id
-        if job_path.exists():
-            current_dir = job_path
-            break
-    
+    current_dir = _find_job_dir(job_id)
     if current_dir is None:
         raise FileNotFoundError(f"Job {job_id} not found")
     
     # Move the job directory
     target_job_dir = target_dir / job_id
     shutil.move(str(current_dir), str(target_job_dir))
+    location.set_job_dir(job_id, target_dir)
     
     return target_job_dir
 
 
 def launch_job(job_id: str) -> bool:
-    """Launch a job using systemd-run."""
+    """Launch a job as a transient systemd unit."""
     # Get job metadata
-    meta_data = get_job_meta(job_id)
+    meta_file, meta_data = _read_job_meta(job_id)
     if not meta_data:
         return False
     
@@ -186,7 +272,6 @@ def launch_job(job_id: str) -> bool:
     
     job_dir = QUEUE_DIR / job_id
     script_file = job_dir / SCRIPT_FILE
-    meta_file = job_dir / META_FILE
     
     # Get the original workdir where the script was submitted
     original_workdir = meta_data.get("workdir", str(job_dir))
@@ -200,7 +285,7 @@ def launch_job(job_id: str) -> bool:
     stdout_path = Path(original_workdir) / expand_paths(stdout_template, meta_data["name"], job_id)
     stderr_path = Path(original_workdir) / expand_paths(stderr_template, meta_data["name"], job_id)
 
-    # Prepare systemd-run command
+    # Resources for the transient unit
     req = meta_data.get("req", {})
     cores = req.get("cores", 1)
     mem_mb = req.get("mem_mb", 1024)
@@ -208,50 +293,34 @@ def launch_job(job_id: str) -> bool:
     # Use the original workdir as the working directory for the job
     workdir = original_workdir
 
-    # Calculate CPU quota (cores * 100%)
-    cpu_quota = f"{cores * 100}%"
-    # Format memory as MB with 'M' suffix
-    mem_max = f"{mem_mb}M"
-
     unit_name = SYSTEMD_UNIT_TEMPLATE.format(jobid=job_id)
 
-    cmd = [
-        "systemd-run",
-        "--user",  # Run in user context
-        "--unit", unit_name,
-        "--collect",
-        "--property=CPUQuota=" + cpu_quota,
-        "--property=MemoryMax=" + mem_max,
-        "--property=WorkingDirectory=" + workdir,
-        "--property=StandardOutput=append:" + str(stdout_path),
-        "--property=StandardError=append:" + str(stderr_path),
-        "--property=KillMode=mixed",
-        "--property=TimeoutStopSec=15s"
-    ]
-
-    # Add time limit if specified
-    if time_limit:
-        cmd.append(f"--property=RuntimeMax={time_limit}")
-
     # For execution, we'll create a temporary script in the workdir with a unique name
     # to avoid conflicts if multiple jobs run in the same directory
     temp_script_name = f".jqs_job_{job_id}_script.sh"
     temp_script_path = Path(workdir) / temp_script_name
     
-    # Copy the script content to the workdir
-    shutil.copy2(script_file, temp_script_path)
-    # Make it executable
-    temp_script_path.chmod(0o755)
+    # Hard link the script into the workdir, copying it only if that fails
+    # (e.g. the workdir is on another filesystem). A hard link shares the
+    # queued script's inode and mode, so the queued copy is made executable
+    # explicitly; that is the mode the run needs either way.
+    os.chmod(script_file, 0o755)
+    try:
+        os.link(script_file, temp_script_path)
+    except OSError:
+        shutil.copyfile(script_file, temp_script_path)
+        os.chmod(temp_script_path, 0o755)
 
-    # Add the script execution command
-    cmd.extend(["/bin/bash", "-lc", f"./{temp_script_name}; rm -f ./{temp_script_name}"])
+    # The script execution command
+    command = ["/bin/bash", "-lc", f"./{temp_script_name}; rm -f ./{temp_script_name}"]
     
     try:
-        # Execute the systemd-run command
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        # Start the job as a transient systemd unit
+        systemd.start_transient_unit(unit_name, command, workdir, str(stdout_path),
+                                     str(stderr_path), cores, mem_mb, time_limit)
         
         # Update job state to RUNNING
-        update_state(job_id, RUNNING)
+        update_state(job_id, RUNNING, existing_meta=meta_data, meta_file=meta_file)
         
         # Move job from queue to running
         move_job(job_id, RUNNING_DIR)
@@ -260,9 +329,12 @@ def launch_job(job_id: str) -> bool:
         update_usage(delta_cores=req["cores"], delta_mem_mb=req["mem_mb"])
         
         return True
-    except subprocess.CalledProcessError as e:
-        # Mark job as failed if systemd-run fails
-        update_state(job_id, FAILED, {"exit_code": e.returncode})
+    # The job may already have been moved to running/ when these fail, so
+    # they look it up again instead of using the queue path
+    except systemd.SystemdError as e:
+        # Mark job as failed if systemd refuses to start the unit
+        update_state(job_id, FAILED, {"exit_code": e.returncode}, existing_meta=meta_data,
+                     meta_file=_current_meta_file(job_id))
         move_job(job_id, FINISHED_DIR)
         # Release resources
         req = meta_data.get("req", {})
@@ -270,7 +342,8 @@ def launch_job(job_id: str) -> bool:
         return False
     except Exception as e:
         # Mark job as failed if there's any other error
-        update_state(job_id, FAILED, {"exit_code": 1})
+        update_state(job_id, FAILED, {"exit_code": 1}, existing_meta=meta_data,
+                     meta_file=_current_meta_file(job_id))
         move_job(job_id, FINISHED_DIR)
         # Release resources
         req = meta_data.get("req", {})
@@ -280,7 +353,7 @@ def launch_job(job_id: str) -> bool:
 
 def cancel_job(job_id: str) -> bool:
     """Cancel a job by stopping it if running or updating state if pending."""
-    meta_data = get_job_meta(job_id)
+    meta_file, meta_data = _read_job_meta(job_id)
     if not meta_data:
         return False
     
@@ -288,22 +361,21 @@ def cancel_job(job_id: str) -> bool:
     
     if current_state == PENDING:
         # For pending jobs, just update the state
-        update_state(job_id, CANCELLED)
+        update_state(job_id, CANCELLED, existing_meta=meta_data, meta_file=meta_file)
         move_job(job_id, FINISHED_DIR)
         return True
     elif current_state == RUNNING:
         # For running jobs, first update the state to CANCELLED
-        update_state(job_id, CANCELLED)
+        update_state(job_id, CANCELLED, existing_meta=meta_data, meta_file=meta_file)
         
         # Then, stop the systemd unit
         unit_name = meta_data.get("unit_name")
         if unit_name:
             try:
                 # Stop the systemd unit
-                subprocess.run(["systemctl", "stop", unit_name], 
-                             check=True, capture_output=True)
-            except subprocess.CalledProcessError:
-                # If systemctl fails, the job is already marked as cancelled
+                systemd.stop_unit(unit_name)
+            except systemd.SystemdError:
+                # If stopping fails, the job is already marked as cancelled
                 # so we just log the issue and move on
                 pass
         
@@ -0,0 +1,37 @@
+"""Job location tracking for the job scheduling system.
+
+Records which state directory (queue, running or finished) currently holds
+each job, so jobs can be found without probing every directory.
+"""
+
+from pathlib import Path
+from typing import Optional
+
+from .config import QUEUE_DIR, RUNNING_DIR, FINISHED_DIR
+from .index import connect
+
+_STATE_DIRS = {state_dir.name: state_dir for state_dir in [QUEUE_DIR, RUNNING_DIR, FINISHED_DIR]}
+
+
+def get_job_dir(job_id: str) -> Optional[Path]:
+    """Return the recorded directory of a job, or None if it is not tracked."""
+    row = connect().execute("SELECT dir FROM locations WHERE job_id = ?", (job_id,)).fetchone()
+    if row is None or row[0] not in _STATE_DIRS:
+        return None
+    return _STATE_DIRS[row[0]] / job_id
+
+
+def set_job_dir(job_id: str, state_dir: Path) -> None:
+    """Record that a job now lives in the given state directory."""
+    if state_dir.name not in _STATE_DIRS:
+        forget_job(job_id)
+        return
+    connect().execute(
+        "INSERT OR REPLACE INTO locations (job_id, dir) VALUES (?, ?)",
+        (job_id, state_dir.name)
+    )
+
+
+def forget_job(job_id: str) -> None:
+    """Stop tracking a job."""
+    connect().execute("DELETE FROM locations WHERE job_id = ?", (job_id,))
@@ -1,86 +1,83 @@
 """Scheduler for the job scheduling system."""
 
 import json
-import subprocess
+import os
+import shutil
+import threading
 import time
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 from .config import (
-    QUEUE_DIR, RUNNING_DIR, FINISHED_DIR, META_FILE, PENDING, RUNNING, 
+    QUEUE_DIR, RUNNING_DIR, FINISHED_DIR, TRASH_DIR, META_FILE, PENDING, RUNNING, 
     COMPLETED, FAILED, CANCELLED
 )
-from .utils import read_json, write_json, iso8601_now
-from .state import get_limits, get_usage, update_usage
+from .utils import (
+    read_json, read_many_json, write_json, iso8601_now, scan_job_dirs, ensure_dir,
+    prune_jobid_shards
+)
+from .state import get_limits, get_usage, update_usage, UsageTransaction
 from .job import update_state, move_job, launch_job
+from . import index, location, systemd
+from .events import SchedulerEvents
 
 
 def scan_running_jobs() -> List[Dict[str, Any]]:
     """Scan running jobs and update their status."""
     completed_jobs = []
     
-    for job_dir in RUNNING_DIR.iterdir():
-        if not job_dir.is_dir():
-            continue
-            
-        meta_file = job_dir / META_FILE
-        if not meta_file.exists():
-            continue
-            
-        meta_data = read_json(meta_file)
+    meta_files = [os.path.join(entry.path, META_FILE) for entry in scan_job_dirs(RUNNING_DIR)]
+    
+    # Skip jobs without a systemd unit name
+    running_jobs = [meta_data for meta_data in read_many_json(meta_files)
+                    if meta_data.get("unit_name")]
+    
+    if not running_jobs:
+        return completed_jobs
+    
+    # Check the status of all systemd units at once
+    unit_names = [meta_data["unit_name"] for meta_data in running_jobs]
+    try:
+        units = systemd.show_units(unit_names)
+    except systemd.SystemdError:
+        # Fall back to one query per unit. Units that still cannot be queried
+        # are left out and checked again next cycle: a failed query does not
+        # mean the job has stopped.
+        units = {}
+        for unit_name in unit_names:
+            try:
+                units.update(systemd.show_units([unit_name]))
+            except systemd.SystemdError:
+                pass
+    
+    for meta_data in running_jobs:
         job_id = meta_data.get("job_id")
         unit_name = meta_data.get("unit_name")
+        meta_file = RUNNING_DIR / job_id / META_FILE
         
-        if not unit_name:
-            continue  # Skip if no systemd unit name
+        properties = units.get(systemd.unit_id(unit_name))
+        if properties is None:
+            continue  # Unit state unknown this cycle; keep the job running
         
-        # Check the status of the systemd unit
-        try:
-            result = subprocess.run(
-                ["systemctl", "show", "--property=ActiveState,ExecMainStatus,SubState", unit_name],
-                capture_output=True, text=True, check=True
-            )
-            
-            # Parse systemctl output
-            properties = {}
-            for line in result.stdout.strip().split('\n'):
-                if '=' in line:
-                    key, value = line.split('=', 1)
-                    properties[key] = value
+        active_state = properties.get("ActiveState", "")
+        exec_status = properties.get("ExecMainStatus", "0")  # Default to 0 (success)
+        sub_state = properties.get("SubState", "")
+        
+        # Determine if job is still running or has completed
+        # Job is completed if it's inactive and in dead/exited state
+        if active_state == "inactive" and sub_state in ["exited", "dead"]:
+            # Job has completed
+            exit_code = int(exec_status) if exec_status.isdigit() else 0
             
-            active_state = properties.get("ActiveState", "")
-            exec_status = properties.get("ExecMainStatus", "0")  # Default to 0 (success)
-            sub_state = properties.get("SubState", "")
+            # Update state based on exit code
+            if exit_code == 0:
+                new_state = COMPLETED
+            else:
+                new_state = FAILED
             
-            # Determine if job is still running or has completed
-            # Job is completed if it's inactive and in dead/exited state
-            if active_state == "inactive" and sub_state in ["exited", "dead"]:
-                # Job has completed
-                exit_code = int(exec_status) if exec_status.isdigit() else 0
-                
-                # Update state based on exit code
-                if exit_code == 0:
-                    new_state = COMPLETED
-                else:
-                    new_state = FAILED
-                
-                # Update job state and move to finished
-                update_state(job_id, new_state, {"exit_code": exit_code})
-                move_job(job_id, FINISHED_DIR)
-                
-                # Release resources
-                req = meta_data.get("req", {})
-                update_usage(delta_cores=-req["cores"], delta_mem_mb=-req["mem_mb"])
-                
-                completed_jobs.append({
-                    "job_id": job_id,
-                    "state": new_state,
-                    "exit_code": exit_code
-                })
-        except subprocess.CalledProcessError:
-            # If systemctl show fails, the job might have completed, failed or been cancelled.
-            # We mark it as FAILED to be safe, as we can't determine the exact exit code.
-            update_state(job_id, FAILED, {"exit_code": -1, "notes": "Systemd unit disappeared unexpectedly"})
+            # Update job state and move to finished
+            update_state(job_id, new_state, {"exit_code": exit_code},
+                         existing_meta=meta_data, meta_file=meta_file)
             move_job(job_id, FINISHED_DIR)
             
             # Release resources
@@ -89,8 +86,8 @@ def scan_running_jobs() -> List[Dict[str, Any]]:
             
             completed_jobs.append({
                 "job_id": job_id,
-                "state": FAILED,
-                "exit_code": -1
+                "state": new_state,
+                "exit_code": exit_code
             })
     
     return completed_jobs
@@ -107,26 +104,14 @@ def scan_queue_and_schedule() -> List[str]:
     available_cores = limits["cores_total"] - usage["cores_used"]
     available_mem = limits["mem_mb_total"] - usage["mem_mb_used"]
     
-    # Get all pending jobs, sorted by submission time
-    pending_jobs = []
-    for job_dir in QUEUE_DIR.iterdir():
-        if not job_dir.is_dir():
-            continue
-            
-        meta_file = job_dir / META_FILE
-        if meta_file.exists():
-            meta_data = read_json(meta_file)
-            if meta_data.get("state") == PENDING:
-                pending_jobs.append((meta_data.get("submit_time"), meta_data.get("job_id"), meta_data))
-    
-    # Sort by submission time (earliest first)
-    pending_jobs.sort(key=lambda x: x[0])
+    # Get all pending jobs from the index, sorted by submission time
+    pending_jobs = index.query(state=PENDING, order_by="submit_time")
     
     # Try to launch jobs that fit within available resources
-    for _, job_id, meta_data in pending_jobs:
-        req = meta_data.get("req", {})
-        req_cores = req.get("cores", 1)
-        req_mem = req.get("mem_mb", 1024)
+    for job in pending_jobs:
+        job_id = job["job_id"]
+        req_cores = job["cores"]
+        req_mem = job["mem_mb"]
         
         # Check if we have enough resources
         if available_cores >= req_cores and available_mem >= req_mem:
@@ -141,45 +126,134 @@ def scan_queue_and_schedule() -> List[str]:
     return scheduled_jobs
 
 
+_trash_wakeup = threading.Event()
+_trash_thread: Optional[threading.Thread] = None
+
+# Age after which a job staging directory in the queue is treated as abandoned
+_STAGING_STALE_SEC = 3600
+
+
+def empty_trash() -> None:
+    """Delete everything that was moved to the trash directory."""
+    try:
+        with os.scandir(TRASH_DIR) as it:
+            entries = list(it)
+    except FileNotFoundError:
+        return
+    
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path, ignore_errors=True)
+        else:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+
+
+def _drain_trash() -> None:
+    """Empty the trash directory whenever cleanup_old_jobs adds to it."""
+    while True:
+        empty_trash()
+        _trash_wakeup.wait()
+        _trash_wakeup.clear()
+
+
+def start_trash_drainer() -> None:
+    """Start the background thread that empties the trash directory."""
+    global _trash_thread
+    if _trash_thread is None:
+        _trash_thread = threading.Thread(target=_drain_trash, name="jqs-trash", daemon=True)
+        _trash_thread.start()
+
+
+def _sweep_stale_staging() -> int:
+    """Move staging directories abandoned by crashed submissions to the trash."""
+    swept = 0
+    cutoff = time.time() - _STAGING_STALE_SEC
+    try:
+        entries = list(os.scandir(QUEUE_DIR))
+    except FileNotFoundError:
+        return 0
+    
+    for entry in entries:
+        if not (entry.name.startswith(".") and entry.name.endswith(".new")):
+            continue
+        try:
+            if entry.stat(follow_symlinks=False).st_mtime >= cutoff:
+                continue
+            ensure_dir(str(TRASH_DIR))
+            os.rename(entry.path, TRASH_DIR / f"{entry.name[1:]}.{int(time.time() * 1000000)}")
+        except OSError:
+            continue
+        swept += 1
+    
+    return swept
+
+
 def cleanup_old_jobs(history_keep: int = 100) -> int:
-    """Remove old finished jobs to keep only the most recent ones."""
-    finished_jobs = []
-    for job_dir in FINISHED_DIR.iterdir():
-        if job_dir.is_dir():
-            meta_file = job_dir / META_FILE
-            if meta_file.exists():
-                meta_data = read_json(meta_file)
-                end_time = meta_data.get("end_time")
-                if end_time:
-                    finished_jobs.append((end_time, job_dir))
-    
-    # Sort by end time (oldest first)
-    finished_jobs.sort(key=lambda x: x[0])
-    
-    # Remove oldest jobs beyond the history limit
+    """Remove old finished jobs to keep only the most recent ones.
+
+    Job directories are renamed into the trash directory, which is emptied
+    by the background drainer if it is running, or right away otherwise.
+    Staging directories left behind by interrupted submissions go the same way.
+    """
+    swept_count = _sweep_stale_staging()
     removed_count = 0
-    for _, job_dir in finished_jobs[:-history_keep] if len(finished_jobs) > history_keep else []:
+    for job_id in index.expired_jobs(history_keep):
+        ensure_dir(str(TRASH_DIR))
         try:
-            import shutil
-            shutil.rmtree(job_dir)
-            removed_count += 1
+            os.rename(FINISHED_DIR / job_id, TRASH_DIR / f"{job_id}.{int(time.time() * 1000000)}")
+        except FileNotFoundError:
+            pass  # Already gone; just drop it from the index
         except OSError:
-            # Skip if we can't remove the directory
+            # Skip if we can't move the directory
             continue
+        
+        index.delete_job(job_id)
+        location.forget_job(job_id)
+        removed_count += 1
+    
+    if removed_count or swept_count:
+        if _trash_thread is not None:
+            _trash_wakeup.set()
+        else:
+            empty_trash()
     
     return removed_count
 
 
+def reconcile_index() -> bool:
+    """Rebuild the index if it disagrees with the queue or running directories.
+
+    Scheduling reads jobs from the index alone, so a job whose index update
+    was lost (e.g. the submitter died after the rename) would otherwise never
+    run. Comparing counts is cheap and catches that without reading meta.json.
+    """
+    for state_dir, state in [(QUEUE_DIR, PENDING), (RUNNING_DIR, RUNNING)]:
+        if len(scan_job_dirs(state_dir)) != index.count_jobs(state):
+            index.rebuild()
+            return True
+    
+    return False
+
+
 def run_scheduler_cycle() -> Dict[str, Any]:
     """Run one cycle of the scheduler."""
-    # First, scan running jobs and update their status
-    completed_jobs = scan_running_jobs()
+    # Pick up jobs the index lost track of
+    reconcile_index()
     
-    # Then, scan queue and schedule new jobs
-    scheduled_jobs = scan_queue_and_schedule()
+    # Batch the cycle's usage updates into a single write of usage.json
+    with UsageTransaction():
+        # First, scan running jobs and update their status
+        completed_jobs = scan_running_jobs()
+        
+        # Then, scan queue and schedule new jobs
+        scheduled_jobs = scan_queue_and_schedule()
     
-    # Cleanup old jobs
+    # Cleanup old jobs, and job ID counter shards left by exited processes
     cleaned_jobs = cleanup_old_jobs()
+    prune_jobid_shards()
     
     return {
         "completed_jobs": completed_jobs,
@@ -191,6 +265,11 @@ def run_scheduler_cycle() -> Dict[str, Any]:
 def run_scheduler(poll_interval_sec: int = 5) -> None:
     """Run the scheduler loop."""
     print(f"Starting scheduler with poll interval {poll_interval_sec}s...")
+    start_trash_drainer()
+    
+    # Wake early on submissions and unit exits; the poll interval stays the
+    # upper bound so nothing a missed event would have reported waits longer
+    events = SchedulerEvents()
     
     try:
         while True:
@@ -202,6 +281,6 @@ def run_scheduler(poll_interval_sec: int = 5) -> None:
                 print(f"  Scheduled jobs: {len(result['scheduled_jobs'])}")
                 print(f"  Cleaned jobs: {result['cleaned_jobs']}")
             
-            time.sleep(poll_interval_sec)
+            events.wait(poll_interval_sec)
     except KeyboardInterrupt:
         print("\nScheduler stopped by user")
\ No newline at end of file
@@ -1,15 +1,36 @@
 """State management for the job scheduling system."""
 
 import json
+import os
+import sys
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
-from .config import LIMITS_FILE, USAGE_FILE, JOBID_COUNTER_FILE, BASE_DIR
-from .utils import read_json, write_json, with_file_lock
+from .config import (
+    LIMITS_FILE, USAGE_FILE, JOBID_COUNTER_FILE, BASE_DIR, QUEUE_DIR, RUNNING_DIR,
+    FINISHED_DIR, LOCKS_DIR
+)
+from .utils import read_json, write_json, lock_acquire, ensure_dir, prune_jobid_shards
+
+
+# Last limits read, with the (inode, mtime, size) stamp of limits.json it came from
+_LIMITS_CACHE: Dict[str, Any] = {"stamp": None, "data": None}
 
 
 def get_limits() -> Dict[str, Any]:
-    """Read system limits from limits.json."""
+    """Read system limits from limits.json.
+
+    The parsed limits are reused until limits.json changes on disk.
+    """
+    try:
+        st = os.stat(LIMITS_FILE)
+        stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        stamp = None
+    
+    if stamp is not None and stamp == _LIMITS_CACHE["stamp"]:
+        return _LIMITS_CACHE["data"]
+    
     limits = read_json(LIMITS_FILE)
     
     # Initialize with defaults if file doesn't exist
@@ -18,15 +39,22 @@ def get_limits() -> Dict[str, Any]:
             "cores_total": 16,
             "mem_mb_total": 65536
         }
-        # Ensure directory exists and write defaults
-        BASE_DIR.mkdir(parents=True, exist_ok=True)
-        write_json(LIMITS_FILE, limits)
+        # Ensure directory exists and write defaults; limits.json is edited by hand
+        ensure_dir(str(BASE_DIR))
+        write_json(LIMITS_FILE, limits, pretty=True)
+    elif stamp is not None:
+        _LIMITS_CACHE["stamp"] = stamp
+        _LIMITS_CACHE["data"] = limits
     
     return limits
 
 
 def get_usage() -> Dict[str, Any]:
     """Read current resource usage from usage.json."""
+    # Inside a usage transaction, report usage including its pending deltas
+    if _active_transaction is not None:
+        return _active_transaction.usage()
+    
     usage = read_json(USAGE_FILE)
     
     # Initialize with defaults if file doesn't exist
@@ -41,31 +69,105 @@ def get_usage() -> Dict[str, Any]:
     return usage
 
 
+def _apply_delta(usage: Dict[str, Any], limits: Dict[str, Any],
+                 delta_cores: int, delta_mem_mb: int) -> Dict[str, Any]:
+    """Return usage with delta values added, checking it against limits."""
+    new_cores = usage["cores_used"] + delta_cores
+    new_mem = usage["mem_mb_used"] + delta_mem_mb
+    
+    # Check if update would exceed limits
+    if new_cores > limits["cores_total"] or new_mem > limits["mem_mb_total"]:
+        raise ValueError(f"Resource limit exceeded: cores={new_cores}/{limits['cores_total']}, "
+                       f"mem={new_mem}/{limits['mem_mb_total']}MB")
+    
+    if new_cores < 0 or new_mem < 0:
+        raise ValueError("Resource usage cannot be negative")
+    
+    usage["cores_used"] = new_cores
+    usage["mem_mb_used"] = new_mem
+    return usage
+
+
 def update_usage(delta_cores: int = 0, delta_mem_mb: int = 0) -> Dict[str, Any]:
     """Update resource usage by adding delta values."""
-    def _update():
-        usage = get_usage()
-        limits = get_limits()
-        
-        new_cores = usage["cores_used"] + delta_cores
-        new_mem = usage["mem_mb_used"] + delta_mem_mb
-        
-        # Check if update would exceed limits
-        if new_cores > limits["cores_total"] or new_mem > limits["mem_mb_total"]:
-            raise ValueError(f"Resource limit exceeded: cores={new_cores}/{limits['cores_total']}, "
-                           f"mem={new_mem}/{limits['mem_mb_total']}MB")
-        
-        if new_cores < 0 or new_mem < 0:
-            raise ValueError("Resource usage cannot be negative")
+    # Inside a usage transaction, only accumulate the deltas
+    if _active_transaction is not None:
+        return _active_transaction.add(delta_cores, delta_mem_mb)
+    
+    # Limits are only read, so load them before taking the lock
+    limits = get_limits()
+    
+    # Use file locking for atomic update
+    with lock_acquire(BASE_DIR / "usage.lock"):
+        usage = _apply_delta(get_usage(), limits, delta_cores, delta_mem_mb)
+        write_json(USAGE_FILE, usage)
+    return usage
+
+
+class UsageTransaction:
+    """Batch resource usage updates into a single write of usage.json.
+
+    While the transaction is active, update_usage checks each delta against
+    the limits and accumulates it in memory, and get_usage reports usage with
+    the accumulated deltas applied. On exit the total delta is added to
+    usage.json under the usage lock, so updates made by other processes in
+    the meantime are kept. It is not checked against the limits again, since
+    the launches and completions it records have already happened.
+    """
+    
+    def __init__(self):
+        self.delta_cores = 0
+        self.delta_mem_mb = 0
+        self._base: Dict[str, Any] = {}
+    
+    def __enter__(self) -> "UsageTransaction":
+        global _active_transaction
+        if _active_transaction is not None:
+            raise RuntimeError("A usage transaction is already active")
         
-        usage["cores_used"] = new_cores
-        usage["mem_mb_used"] = new_mem
+        self._base = dict(get_usage())
+        _active_transaction = self
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        global _active_transaction
+        _active_transaction = None
         
-        write_json(USAGE_FILE, usage)
-        return usage
+        # Apply the deltas even if the cycle failed part way, since the jobs
+        # they account for have already been launched or finished
+        if self.delta_cores or self.delta_mem_mb:
+            self._commit()
     
-    # Use file locking for atomic update
-    return with_file_lock(BASE_DIR / "usage.lock", _update)
+    def _commit(self) -> None:
+        """Add the accumulated deltas to usage.json, clamping usage at zero."""
+        with lock_acquire(BASE_DIR / "usage.lock"):
+            usage = get_usage()
+            new_cores = usage["cores_used"] + self.delta_cores
+            new_mem = usage["mem_mb_used"] + self.delta_mem_mb
+            if new_cores < 0 or new_mem < 0:
+                print(f"Warning: resource usage went negative (cores={new_cores}, "
+                      f"mem={new_mem}MB); clamping to 0", file=sys.stderr)
+            usage["cores_used"] = max(new_cores, 0)
+            usage["mem_mb_used"] = max(new_mem, 0)
+            write_json(USAGE_FILE, usage)
+    
+    def usage(self) -> Dict[str, Any]:
+        """Return usage including the deltas accumulated so far."""
+        return {
+            "cores_used": self._base["cores_used"] + self.delta_cores,
+            "mem_mb_used": self._base["mem_mb_used"] + self.delta_mem_mb
+        }
+    
+    def add(self, delta_cores: int, delta_mem_mb: int) -> Dict[str, Any]:
+        """Check and accumulate a usage delta."""
+        usage = _apply_delta(self.usage(), get_limits(), delta_cores, delta_mem_mb)
+        self.delta_cores += delta_cores
+        self.delta_mem_mb += delta_mem_mb
+        return usage
+
+
+# Usage transaction of the running scheduler cycle, if any
+_active_transaction: Optional[UsageTransaction] = None
 
 
 def get_next_jobid() -> str:
@@ -76,15 +178,19 @@ def get_next_jobid() -> str:
 
 def init_system() -> None:
     """Initialize the system with default configuration files."""
-    # Ensure base directory exists
-    BASE_DIR.mkdir(parents=True, exist_ok=True)
+    # Ensure base directory and the job and lock directories exist
+    for path in [BASE_DIR, QUEUE_DIR, RUNNING_DIR, FINISHED_DIR, LOCKS_DIR]:
+        ensure_dir(str(path))
+    
+    # Drop job ID counter shards left by processes that have exited
+    prune_jobid_shards()
     
     # Initialize limits.json if it doesn't exist
     if not LIMITS_FILE.exists():
         write_json(LIMITS_FILE, {
             "cores_total": 16,
             "mem_mb_total": 65536
-        })
+        }, pretty=True)
     
     # Initialize usage.json if it doesn't exist
     if not USAGE_FILE.exists():
@@ -0,0 +1,276 @@
+"""systemd integration for the job scheduling system.
+
+Units are managed over a persistent D-Bus connection to the user's systemd
+instance when dasbus is installed, and through the systemctl/systemd-run
+commands otherwise.
+"""
+
+import re
+import subprocess
+import threading
+from typing import Callable, Dict, Any, List, Optional
+
+try:
+    from dasbus.connection import SessionMessageBus
+    from dasbus.error import DBusError
+    from dasbus.loop import EventLoop
+    from dasbus.typing import Variant
+except ImportError:
+    SessionMessageBus = None
+
+SYSTEMD_SERVICE = "org.freedesktop.systemd1"
+SYSTEMD_PATH = "/org/freedesktop/systemd1"
+MANAGER_INTERFACE = "org.freedesktop.systemd1.Manager"
+UNIT_INTERFACE = "org.freedesktop.systemd1.Unit"
+SERVICE_INTERFACE = "org.freedesktop.systemd1.Service"
+NO_SUCH_UNIT_ERROR = "org.freedesktop.systemd1.NoSuchUnit"
+
+# Microseconds per systemd time span unit
+_TIMESPAN_USEC = {
+    "": 1000000, "s": 1000000, "sec": 1000000, "second": 1000000, "seconds": 1000000,
+    "us": 1, "usec": 1, "ms": 1000, "msec": 1000,
+    "m": 60000000, "min": 60000000, "minute": 60000000, "minutes": 60000000,
+    "h": 3600000000, "hr": 3600000000, "hour": 3600000000, "hours": 3600000000,
+    "d": 86400000000, "day": 86400000000, "days": 86400000000,
+    "w": 604800000000, "week": 604800000000, "weeks": 604800000000,
+}
+_TIMESPAN_PART = re.compile(r'\s*(\d+(?:\.\d+)?)\s*([a-z]*)')
+
+_bus = None
+_manager = None
+_dbus_failed = False
+
+
+class SystemdError(Exception):
+    """A systemd operation failed."""
+
+    def __init__(self, message: str, returncode: int = 1):
+        super().__init__(message)
+        self.returncode = returncode
+
+
+def unit_id(unit_name: str) -> str:
+    """Return the full unit ID systemd reports for a unit name."""
+    return unit_name if "." in unit_name else unit_name + ".service"
+
+
+def parse_timespan_usec(value: str) -> int:
+    """Convert a systemd time span such as "1h 30min" to microseconds."""
+    total = 0
+    pos = 0
+    value = value.strip()
+    while pos < len(value):
+        match = _TIMESPAN_PART.match(value, pos)
+        if not match or match.group(2) not in _TIMESPAN_USEC:
+            raise ValueError(f"Invalid time span: {value}")
+        total += int(float(match.group(1)) * _TIMESPAN_USEC[match.group(2)])
+        pos = match.end()
+
+    if pos == 0:
+        raise ValueError(f"Invalid time span: {value}")
+    return total
+
+
+def _get_manager():
+    """Return the systemd manager proxy, or None if D-Bus is unavailable."""
+    global _bus, _manager, _dbus_failed
+    if _manager is not None or _dbus_failed or SessionMessageBus is None:
+        return _manager
+
+    try:
+        bus = SessionMessageBus()
+        manager = bus.get_proxy(SYSTEMD_SERVICE, SYSTEMD_PATH, MANAGER_INTERFACE)
+        manager.Version  # Fail now rather than on first use if there is no user bus
+    except Exception:
+        # Fall back to the command line tools for the rest of the process
+        _dbus_failed = True
+        return None
+
+    _bus = bus
+    _manager = manager
+    return _manager
+
+
+def subscribe_unit_removed(callback: Callable[[str], None]) -> bool:
+    """Call callback with the unit name whenever systemd unloads a unit.
+
+    Job units are started with CollectMode=inactive-or-failed, so they are
+    unloaded as soon as their service exits, whether it finished by itself,
+    failed or was stopped.
+
+    Signals are dispatched from a background event loop thread. Returns False
+    if D-Bus is unavailable.
+    """
+    manager = _get_manager()
+    if manager is None:
+        return False
+
+    try:
+        # The user manager only emits unit signals to subscribed clients
+        manager.Subscribe()
+        manager.UnitRemoved.connect(lambda unit, unit_path: callback(unit))
+    except Exception:
+        return False
+
+    threading.Thread(target=EventLoop().run, name="jqs-dbus", daemon=True).start()
+    return True
+
+
+def show_units(unit_names: List[str]) -> Dict[str, Dict[str, str]]:
+    """Query unit state for several systemd units at once.
+
+    Returns the ActiveState, SubState and ExecMainStatus of each unit keyed by
+    its full unit ID. Over D-Bus, a unit that could not be queried is left out
+    of the result rather than failing the others.
+    """
+    manager = _get_manager()
+    if manager is None:
+        return _show_units_systemctl(unit_names)
+
+    units = {}
+    for name in unit_names:
+        full_id = unit_id(name)
+        try:
+            units[full_id] = _show_unit_dbus(manager, full_id)
+        except DBusError as e:
+            if getattr(e, "dbus_name", None) == NO_SUCH_UNIT_ERROR:
+                # Report a unit systemd no longer knows the way systemctl does
+                units[full_id] = {
+                    "Id": full_id,
+                    "ActiveState": "inactive",
+                    "SubState": "dead",
+                    "ExecMainStatus": "0"
+                }
+        except TimeoutError:
+            pass
+
+    return units
+
+
+def _show_unit_dbus(manager, full_id: str) -> Dict[str, str]:
+    """Query the state of one unit over D-Bus."""
+    # LoadUnit, unlike GetUnit, also answers for units that were collected
+    path = manager.LoadUnit(full_id)
+    unit = _bus.get_proxy(SYSTEMD_SERVICE, path, UNIT_INTERFACE)
+    properties = {
+        "Id": full_id,
+        "ActiveState": unit.ActiveState,
+        "SubState": unit.SubState,
+        "ExecMainStatus": "0"
+    }
+    try:
+        service = _bus.get_proxy(SYSTEMD_SERVICE, path, SERVICE_INTERFACE)
+        properties["ExecMainStatus"] = str(service.ExecMainStatus)
+    except DBusError:
+        pass
+    return properties
+
+
+def _show_units_systemctl(unit_names: List[str]) -> Dict[str, Dict[str, str]]:
+    """Query unit state with one systemctl show call."""
+    try:
+        result = subprocess.run(
+            ["systemctl", "show", "--property=ActiveState,ExecMainStatus,SubState,Id"] + unit_names,
+            capture_output=True, text=True, check=True
+        )
+    except subprocess.CalledProcessError as e:
+        raise SystemdError(e.stderr or str(e), e.returncode)
+
+    # systemctl separates the property blocks of each unit with a blank line
+    units = {}
+    for block in result.stdout.split('\n\n'):
+        properties = {}
+        for line in block.strip().split('\n'):
+            if '=' in line:
+                key, value = line.split('=', 1)
+                properties[key] = value
+
+        if "Id" in properties:
+            units[properties["Id"]] = properties
+
+    return units
+
+
+def stop_unit(unit_name: str) -> None:
+    """Stop a systemd unit."""
+    manager = _get_manager()
+    if manager is None:
+        try:
+            subprocess.run(["systemctl", "stop", unit_name], check=True, capture_output=True)
+        except subprocess.CalledProcessError as e:
+            raise SystemdError(str(e), e.returncode)
+        return
+
+    try:
+        manager.StopUnit(unit_id(unit_name), "replace")
+    except DBusError as e:
+        raise SystemdError(str(e))
+
+
+def start_transient_unit(unit_name: str, command: List[str], workdir: str,
+                         stdout_path: str, stderr_path: str, cores: int, mem_mb: int,
+                         time_limit: Optional[str] = None) -> None:
+    """Start a command as a transient user service with resource limits."""
+    manager = _get_manager()
+    if manager is None:
+        _start_transient_unit_systemd_run(unit_name, command, workdir, stdout_path,
+                                          stderr_path, cores, mem_mb, time_limit)
+        return
+
+    properties = [
+        ("Description", Variant("s", " ".join(command))),
+        ("CollectMode", Variant("s", "inactive-or-failed")),
+        # CPU quota of 100% per core, expressed as CPU time per second
+        ("CPUQuotaPerSecUSec", Variant("t", cores * 1000000)),
+        ("MemoryMax", Variant("t", mem_mb * 1024 * 1024)),
+        ("WorkingDirectory", Variant("s", workdir)),
+        ("StandardOutputFileToAppend", Variant("s", stdout_path)),
+        ("StandardErrorFileToAppend", Variant("s", stderr_path)),
+        ("KillMode", Variant("s", "mixed")),
+        ("TimeoutStopUSec", Variant("t", 15 * 1000000)),
+        ("ExecStart", Variant("a(sasb)", [(command[0], command, False)])),
+    ]
+
+    # Add time limit if specified
+    if time_limit:
+        properties.append(("RuntimeMaxUSec", Variant("t", parse_timespan_usec(time_limit))))
+
+    try:
+        manager.StartTransientUnit(unit_id(unit_name), "fail", properties, [])
+    except DBusError as e:
+        raise SystemdError(str(e))
+
+
+def _start_transient_unit_systemd_run(unit_name: str, command: List[str], workdir: str,
+                                      stdout_path: str, stderr_path: str, cores: int,
+                                      mem_mb: int, time_limit: Optional[str]) -> None:
+    """Start a transient unit with systemd-run."""
+    # Calculate CPU quota (cores * 100%)
+    cpu_quota = f"{cores * 100}%"
+    # Format memory as MB with 'M' suffix
+    mem_max = f"{mem_mb}M"
+
+    cmd = [
+        "systemd-run",
+        "--user",  # Run in user context
+        "--unit", unit_name,
+        "--collect",
+        "--property=CPUQuota=" + cpu_quota,
+        "--property=MemoryMax=" + mem_max,
+        "--property=WorkingDirectory=" + workdir,
+        "--property=StandardOutput=append:" + stdout_path,
+        "--property=StandardError=append:" + stderr_path,
+        "--property=KillMode=mixed",
+        "--property=TimeoutStopSec=15s"
+    ]
+
+    # Add time limit if specified
+    if time_limit:
+        cmd.append(f"--property=RuntimeMax={time_limit}")
+
+    cmd.extend(command)
+
+    try:
+        subprocess.run(cmd, capture_output=True, text=True, check=True)
+    except subprocess.CalledProcessError as e:
+        raise SystemdError(e.stderr or str(e), e.returncode)
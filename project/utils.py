@@ -1,75 +1,527 @@
 """Utility functions for the job scheduling system."""
 
+import atexit
+import errno
 import json
 import os
 import fcntl
+import itertools
+import re
+import threading
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
-from .config import JOBID_COUNTER_FILE, LOCKS_DIR
+from .config import JOBID_COUNTER_FILE, JOBID_SCHEME, LOCKS_DIR
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-def read_json(path: Path) -> Dict[str, Any]:
-    """Read JSON from file."""
-    if not path.exists():
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import liburing
+except ImportError:
+    liburing = None
+
+
+# JSON backends in order of preference: orjson, ujson, then the stdlib.
+# Output is compact unless pretty is set.
+if orjson is not None:
+    def _json_loads(raw: bytes) -> Any:
+        return orjson.loads(raw)
+
+    def _json_dumps(data: Any, pretty: bool = False) -> bytes:
+        # Accept non-string keys like the stdlib json module does
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option)
+elif ujson is not None:
+    def _json_loads(raw: bytes) -> Any:
+        return ujson.loads(raw)
+
+    def _json_dumps(data: Any, pretty: bool = False) -> bytes:
+        return ujson.dumps(data, indent=2 if pretty else 0, ensure_ascii=False,
+                           escape_forward_slashes=False).encode('utf-8')
+else:
+    # json.dumps builds a new encoder for every call with non-default options;
+    # these are built once. ensure_ascii=False keeps non-ASCII text as-is and
+    # leaves the UTF-8 encoding to a single str.encode.
+    _JSON_COMPACT = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+    _JSON_PRETTY = json.JSONEncoder(indent=2, ensure_ascii=False)
+
+    def _json_loads(raw: bytes) -> Any:
+        return json.loads(raw)
+
+    def _json_dumps(data: Any, pretty: bool = False) -> bytes:
+        encoder = _JSON_PRETTY if pretty else _JSON_COMPACT
+        return encoder.encode(data).encode('utf-8')
+
+
+# Raw contents of JSON files keyed by path, each stored with the
+# (inode, mtime, size) stamp it was read at
+_meta_cache: Dict[str, Tuple[Tuple[int, int, int], bytes]] = {}
+_META_CACHE_MAX = 1024
+
+# Buffer size for JSON file I/O, so larger state files move in few syscalls
+_JSON_BUFFER_SIZE = 65536
+
+
+def read_json(path: Union[str, Path]) -> Dict[str, Any]:
+    """Read JSON from file.
+
+    File contents are cached per process and reused while the file's inode,
+    mtime and size are unchanged, which saves the open and read. Each call
+    parses its own dict, so callers may modify the result freely; re-parsing
+    the cached bytes is cheaper than deep-copying a shared dict.
+    """
+    key = os.fspath(path)
+    try:
+        st = os.stat(key)
+    except FileNotFoundError:
         return {}
-    
-    with open(path, 'r', encoding='utf-8') as f:
-        return json.load(f)
 
+    # An empty file (e.g. truncated by a crash) reads as no data
+    if st.st_size == 0:
+        return {}
 
-def write_json(path: Path, data: Dict[str, Any]) -> None:
-    """Write JSON to file."""
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+    cached = _meta_cache.get(key)
+    if cached is not None and cached[0] == stamp:
+        return _json_loads(cached[1])
 
+    with open(key, 'rb', buffering=_JSON_BUFFER_SIZE) as f:
+        raw = f.read()
+    data = _json_loads(raw)
 
-def with_file_lock(lockfile: Path, func, *args, **kwargs):
-    """Execute function with file lock."""
-    # Create parent directory if it doesn't exist
-    lockfile.parent.mkdir(parents=True, exist_ok=True)
+    if len(_meta_cache) >= _META_CACHE_MAX:
+        _meta_cache.clear()
+    _meta_cache[key] = (stamp, raw)
+    return data
+
+
+def write_json(path: Union[str, Path], data: Dict[str, Any], pretty: bool = False) -> None:
+    """Write JSON to file.
+
+    Files are written compactly; pass pretty=True for files people edit by
+    hand. The file is replaced atomically so readers never see a partial
+    write, and the replacement gets a new inode so cached reads of it are
+    invalidated.
+    """
+    key = os.fspath(path)
+    tmp_path = f"{key}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb', buffering=_JSON_BUFFER_SIZE) as f:
+        f.write(_json_dumps(data, pretty))
+    os.replace(tmp_path, key)
+    _meta_cache.pop(key, None)
+
+
+_read_pool: Optional[ThreadPoolExecutor] = None
+
+# io_uring batches are only worth their setup cost for larger reads
+_URING_MIN_BATCH = 16
+_URING_MAX_BATCH = 256
+# Per-file read buffer; meta.json files are far smaller than this
+_URING_READ_SIZE = 8192
+
+
+def _kernel_at_least(major: int, minor: int) -> bool:
+    """Return True if the running Linux kernel is at least major.minor."""
+    uname = os.uname()
+    match = re.match(r'(\d+)\.(\d+)', uname.release)
+    if uname.sysname != "Linux" or not match:
+        return False
+    return (int(match.group(1)), int(match.group(2))) >= (major, minor)
+
+
+# io_uring gained open and close operations in Linux 5.6
+_uring_usable = liburing is not None and _kernel_at_least(5, 6)
+
+
+def _uring_batch(ring, cqe, preps: List[Callable]) -> List[int]:
+    """Submit one SQE per prep callback and return each result, in order.
+
+    Failed operations are reported as negative errno values.
+    """
+    results = [0] * len(preps)
+    for i, prep in enumerate(preps):
+        sqe = liburing.io_uring_get_sqe(ring)
+        prep(sqe)
+        liburing.io_uring_sqe_set_data64(sqe, i)
+    liburing.io_uring_submit_and_wait(ring, len(preps))
+
+    # Completions are already queued, so waiting on each does not block
+    for _ in preps:
+        liburing.io_uring_wait_cqe(ring, cqe)
+        entry = cqe[0]
+        try:
+            res = entry.res
+        except OSError as e:
+            res = -e.errno
+        results[entry.user_data] = res
+        liburing.io_uring_cqe_seen(ring, entry)
+
+    return results
+
+
+def _read_many_uring(paths: List[str]) -> List[Dict[str, Any]]:
+    """Read JSON files with batched io_uring open, read and close requests.
+
+    Files read this way bypass the read_json cache, since no stat is made.
+    """
+    ring = liburing.Ring()
+    cqe = liburing.Cqe()
+    liburing.io_uring_queue_init(_URING_MAX_BATCH, ring)
+
+    how = liburing.OpenHow(os.O_RDONLY | os.O_CLOEXEC, 0, 0)
+    results: List[Dict[str, Any]] = []
+    try:
+        for start in range(0, len(paths), _URING_MAX_BATCH):
+            chunk = paths[start:start + _URING_MAX_BATCH]
+            fds = _uring_batch(ring, cqe, [
+                lambda sqe, path=path: liburing.io_uring_prep_openat2(sqe, path, how)
+                for path in chunk
+            ])
+            opened = [i for i, fd in enumerate(fds) if fd >= 0]
+            buffers = {i: bytearray(_URING_READ_SIZE) for i in opened}
+
+            try:
+                sizes = _uring_batch(ring, cqe, [
+                    lambda sqe, i=i: liburing.io_uring_prep_read(sqe, fds[i], buffers[i], 0)
+                    for i in opened
+                ]) if opened else []
+            finally:
+                if opened:
+                    _uring_batch(ring, cqe, [
+                        lambda sqe, i=i: liburing.io_uring_prep_close(sqe, fds[i])
+                        for i in opened
+                    ])
+
+            chunk_results = [{} if fd == -errno.ENOENT else None for fd in fds]
+            for i, size in zip(opened, sizes):
+                # Files that filled the buffer may be longer: read them normally
+                if 0 <= size < _URING_READ_SIZE:
+                    chunk_results[i] = _json_loads(bytes(buffers[i][:size])) if size else {}
+
+            # Anything that failed for another reason is retried with read_json
+            # so errors surface the same way they do there
+            results.extend(data if data is not None else read_json(path)
+                           for path, data in zip(chunk, chunk_results))
+    finally:
+        liburing.io_uring_queue_exit(ring)
+
+    return results
+
+
+def read_many_json(paths: List[Union[str, Path]]) -> List[Dict[str, Any]]:
+    """Read several JSON files, returning results in order.
+
+    Large batches are read with io_uring when the liburing bindings and a
+    recent enough kernel are available. Otherwise the files are read
+    concurrently on a shared thread pool.
+    """
+    global _read_pool, _uring_usable
+    if len(paths) < 2:
+        return [read_json(path) for path in paths]
+
+    if _uring_usable and len(paths) >= _URING_MIN_BATCH:
+        try:
+            return _read_many_uring([os.fspath(path) for path in paths])
+        except (OSError, AttributeError):
+            # io_uring is unavailable (e.g. blocked by seccomp); stop trying
+            _uring_usable = False
+
+    # Created on first use and kept for the life of the process
+    if _read_pool is None:
+        _read_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="jqs-read")
+    return list(_read_pool.map(read_json, paths))
+
+
+@lru_cache(maxsize=None)
+def ensure_dir(path_str: str) -> None:
+    """Create a directory and its parents, at most once per process."""
+    os.makedirs(path_str, exist_ok=True)
+
+
+def scan_job_dirs(parent: Path) -> List[os.DirEntry]:
+    """List job directories under parent, sorted by inode number.
+
+    Visiting entries in inode order keeps the following meta.json lookups
+    close together in the inode table instead of seeking around for each one.
+    Hidden directories (jobs still being created) are skipped.
+    """
+    try:
+        with os.scandir(parent) as it:
+            entries = [entry for entry in it
+                       if not entry.name.startswith(".") and entry.is_dir(follow_symlinks=False)]
+    except FileNotFoundError:
+        return []
+
+    entries.sort(key=lambda entry: entry.inode())
+    return entries
+
+
+@contextmanager
+def lock_acquire(lockfile: Path) -> Iterator[None]:
+    """Hold an exclusive flock on lockfile for the duration of a with block.
+
+    Keep the block to the reads and writes that need protecting; anything
+    that can be computed beforehand should happen outside it.
+    """
+    # Create parent directory if it doesn't exist, once per process
+    ensure_dir(str(lockfile.parent))
     
     with open(lockfile, 'w') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
         try:
-            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
-            return func(*args, **kwargs)
+            yield
         finally:
             fcntl.flock(f.fileno(), fcntl.LOCK_UN)
 
 
+def with_file_lock(lockfile: Path, func, *args, **kwargs):
+    """Execute function with file lock."""
+    with lock_acquire(lockfile):
+        return func(*args, **kwargs)
+
+
+# Today's date as used in job IDs, the %-format for today's counter job IDs,
+# and the time.time() at which both go stale
+_today = ""
+_today_jobid_fmt = ""
+_today_expires = 0.0
+
+
+def _today_str() -> str:
+    """Return the local date as YYYYMMDD, formatting it only once per day."""
+    global _today, _today_jobid_fmt, _today_expires
+    now = time.time()
+    if now >= _today_expires:
+        lt = time.localtime(now)
+        _today = time.strftime("%Y%m%d", lt)
+        _today_jobid_fmt = _today + "-%04d"
+        # Next local midnight; mktime normalises the day overflow and DST
+        _today_expires = time.mktime((lt.tm_year, lt.tm_mon, lt.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+    return _today
+
+
+def _jobid_format() -> str:
+    """Return the %-format string for today's counter job IDs."""
+    _today_str()  # Rebuilds the format when the date changes
+    return _today_jobid_fmt
+
+
+_process_counter: Optional[Iterator[int]] = None
+
+
+def _process_jobid() -> str:
+    """Generate a job ID from the process ID and an in-memory counter."""
+    global _process_counter
+    if _process_counter is None:
+        # Start from microseconds on the system-wide monotonic clock, which
+        # the wall clock and DST cannot move back. A later process handed the
+        # same pid starts past every ID we issued, unless we averaged more than
+        # one ID per microsecond or the machine rebooted in between.
+        _process_counter = itertools.count(int(time.monotonic() * 1000000))
+    
+    # The full pid: pid_max can be far above 16 bits, so truncating it
+    # would let two live processes share a prefix
+    return f"{_today_str()}-{os.getpid():04x}-{next(_process_counter):06d}"
+
+
+# Job IDs reserved from each counter file but not handed out yet, as
+# [next, end, size of the next reservation]
+_jobid_blocks: Dict[str, List[int]] = {}
+_JOBID_RESERVE_MAX = 64
+# The counter file holds the last reserved value as a zero-padded record
+_COUNTER_WIDTH = 12
+
+# Counter files are kept open for the life of the process, keyed by path
+_counter_fds: Dict[str, int] = {}
+# Process that owns the reserved blocks and open counter files above
+_jobid_pid = 0
+
+
+def _counter_fd(counter_file: Path) -> int:
+    """Return this process's open descriptor for a counter file."""
+    key = os.fspath(counter_file)
+    fd = _counter_fds.get(key)
+    if fd is None:
+        fd = os.open(key, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o644)
+        _counter_fds[key] = fd
+        atexit.register(os.close, fd)
+    return fd
+
+
+def _reserve_jobids(counter_file: Path, count: int) -> int:
+    """Advance the counter file by count and return the first reserved value."""
+    fd = _counter_fd(counter_file)
+    
+    # Lock the counter file itself to ensure atomic increment, holding the
+    # lock only for the read and write of the counter
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    try:
+        # Older counter files hold the bare number, which int() reads too
+        raw = os.pread(fd, _COUNTER_WIDTH, 0)
+        counter = int(raw) if raw.strip() else 0
+        # The fixed-width record always overwrites the whole value in place
+        os.pwrite(fd, b"%0*d" % (_COUNTER_WIDTH, counter + count), 0)
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    
+    return counter + 1
+
+
+_shard_lock = threading.Lock()
+
+
+def _sharded_jobid() -> str:
+    """Generate a job ID from this process's own counter shard."""
+    pid = os.getpid()
+    ensure_dir(str(LOCKS_DIR))
+    fd = _counter_fd(LOCKS_DIR / f"counter.{pid}")
+    
+    # Only this process writes its shard, so no file lock is needed. The
+    # shard outlives the process, so a later process given the same pid
+    # carries on from its sequence instead of repeating it.
+    with _shard_lock:
+        raw = os.pread(fd, _COUNTER_WIDTH, 0)
+        seq = (int(raw) if raw.strip() else 0) + 1
+        os.pwrite(fd, b"%0*d" % (_COUNTER_WIDTH, seq), 0)
+    
+    return f"{_today_str()}-{pid:05d}-{seq:04d}"
+
+
+def _pid_alive(pid: int) -> bool:
+    """Return True if a process with this pid exists."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Exists, but belongs to another user
+    return True
+
+
+def prune_jobid_shards() -> int:
+    """Remove counter shards of the sharded job ID scheme that are no longer needed.
+
+    A shard has to outlive its process so that a later process given the same
+    pid keeps counting past its IDs. The counter itself never resets, so a
+    shard can only go once its process has exited and it was last written
+    before local midnight: none of the IDs it handed out carry today's date,
+    so a fresh shard starting again from 1 cannot repeat one of them.
+    """
+    lt = time.localtime()
+    midnight = time.mktime((lt.tm_year, lt.tm_mon, lt.tm_mday, 0, 0, 0, 0, 0, -1))
+    
+    try:
+        with os.scandir(LOCKS_DIR) as it:
+            shards = [entry for entry in it if entry.name.startswith("counter.")]
+    except FileNotFoundError:
+        return 0
+    
+    removed = 0
+    for entry in shards:
+        pid = entry.name[len("counter."):]
+        if not pid.isdigit():
+            continue
+        try:
+            if entry.stat().st_mtime >= midnight or _pid_alive(int(pid)):
+                continue
+            os.unlink(entry.path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    
+    return removed
+
+
 def generate_jobid(counter_file: Path = JOBID_COUNTER_FILE) -> str:
-    """Generate a new job ID by incrementing the counter."""
-    def _increment_counter():
-        if counter_file.exists():
-            with open(counter_file, 'r') as f:
-                counter = int(f.read().strip())
-        else:
-            counter = 0
-        
-        counter += 1
-        
-        with open(counter_file, 'w') as f:
-            f.write(str(counter))
-        
-        return counter
+    """Generate a new job ID by incrementing the counter.
+
+    A process that keeps allocating IDs reserves them from the counter file
+    in blocks that double in size up to _JOBID_RESERVE_MAX, so bursts write
+    the file once per block rather than once per ID. The counter is written
+    before any ID of a block is used, so a crash can only leave gaps.
+    """
+    global _jobid_pid
+    if JOBID_SCHEME == "process":
+        return _process_jobid()
+    
+    if _jobid_pid != os.getpid():
+        # A forked child must not hand out the parent's reserved IDs, or share
+        # its open counter files: flock locks belong to the open file and
+        # would no longer exclude the two processes
+        _jobid_blocks.clear()
+        _counter_fds.clear()
+        _jobid_pid = os.getpid()
+    
+    if JOBID_SCHEME == "sharded":
+        return _sharded_jobid()
     
-    # Use file locking to ensure atomic increment
-    counter = with_file_lock(LOCKS_DIR / "jobid_counter.lock", _increment_counter)
+    block = _jobid_blocks.setdefault(os.fspath(counter_file), [0, 0, 1])
+    if block[0] >= block[1]:
+        first = _reserve_jobids(counter_file, block[2])
+        block[0], block[1] = first, first + block[2]
+        block[2] = min(block[2] * 2, _JOBID_RESERVE_MAX)
+    
+    counter = block[0]
+    block[0] += 1
     
     # Format: YYYYMMDD-XXXX
-    today = datetime.now().strftime("%Y%m%d")
-    return f"{today}-{counter:04d}"
+    return _jobid_format() % counter
+
+
+# Last whole second formatted by iso8601_now and its formatted text, kept in
+# one tuple so threads always see a matching pair
+_iso_cache = (-1, "")
 
 
 def iso8601_now() -> str:
-    """Return current time in ISO8601 format."""
-    return datetime.now().isoformat()
+    """Return current local time in ISO8601 format, with microseconds."""
+    global _iso_cache
+    now = time.time()
+    second = int(now)
+    cached_second, prefix = _iso_cache
+    if second != cached_second:
+        prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(second))
+        _iso_cache = (second, prefix)
+    # %d truncates the float, which is cheaper than an int() call
+    return "%s.%06d" % (prefix, (now - second) * 1000000)
+
+
+# Placeholders in output path templates, and the format fields they become
+_PCT_RE = re.compile(r'%([xj])')
+_PCT_FIELDS = {"x": "{0}", "j": "{1}"}
+
+
+@lru_cache(maxsize=512)
+def _compile_path_template(template: str) -> str:
+    """Turn a path template into a str.format string taking (name, jobid)."""
+    fmt = template.replace("{", "{{").replace("}", "}}")
+    # Substitute both placeholders in one pass over the template
+    return _PCT_RE.sub(lambda m: _PCT_FIELDS[m.group(1)], fmt)
 
 
 def expand_paths(template: str, job_name: str, job_id: str) -> str:
     """Expand path templates using job info (%x for name, %j for jobid)."""
-    result = template.replace("%x", job_name)
-    result = result.replace("%j", job_id)
-    return result
\ No newline at end of file
+    return _compile_path_template(template).format(job_name, job_id)
+
+
+# Exercise the JSON backend once at import so interpreters that set up their
+# encoder and decoder lazily (PyPy, MicroPython) don't pay for it on the first
+# state file read or write
+try:
+    _json_loads(_json_dumps({"warmup": [None]}))
+except (TypeError, ValueError):
+    pass
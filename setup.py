@@ -1,5 +1,6 @@
 """Setup script for the job scheduling system."""
 
+import os
 import sys
 from pathlib import Path
 
@@ -13,25 +14,31 @@ from project.config import BASE_DIR, QUEUE_DIR, RUNNING_DIR, FINISHED_DIR, LOCKS
 def main():
     print("Initializing job scheduling system...")
     
-    # Call the initialization function
-    init_system()
+    # Snapshot what already exists before initializing, with one directory scan
+    try:
+        with os.scandir(BASE_DIR) as it:
+            existing = {entry.name for entry in it}
+        base_status = "EXISTS"
+    except FileNotFoundError:
+        existing = set()
+        base_status = "CREATED"
     
-    # Check which components were newly created vs already existing
+    # Check which components will be newly created vs already existing
     dirs_status = {
-        "queue": "EXISTS" if QUEUE_DIR.exists() else "CREATED",
-        "running": "EXISTS" if RUNNING_DIR.exists() else "CREATED", 
-        "finished": "EXISTS" if FINISHED_DIR.exists() else "CREATED",
-        "locks": "EXISTS" if LOCKS_DIR.exists() else "CREATED"
+        name: "EXISTS" if name in existing else "CREATED"
+        for name in [QUEUE_DIR.name, RUNNING_DIR.name, FINISHED_DIR.name, LOCKS_DIR.name]
     }
     
     files_status = {
-        "limits.json": "EXISTS" if LIMITS_FILE.exists() else "CREATED",
-        "usage.json": "EXISTS" if USAGE_FILE.exists() else "CREATED", 
-        "jobid_counter": "EXISTS" if JOBID_COUNTER_FILE.exists() else "CREATED"
+        name: "EXISTS" if name in existing else "CREATED"
+        for name in [LIMITS_FILE.name, USAGE_FILE.name, JOBID_COUNTER_FILE.name]
     }
     
+    # Call the initialization function
+    init_system()
+    
     print("System initialization complete!")
-    print(f"Base directory: {BASE_DIR} ({'EXISTS' if BASE_DIR.exists() else 'CREATED'})")
+    print(f"Base directory: {BASE_DIR} ({base_status})")
     print("Directory status:")
     for dir_name, status in dirs_status.items():
         dir_path = BASE_DIR / dir_name